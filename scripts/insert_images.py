@@ -2,11 +2,20 @@ from __future__ import annotations
 
 import argparse
 import sys
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Iterable
 
+from vault_editor.concurrency import (
+    IN_FLIGHT_PER_WORKER,
+    bounded_map,
+    shutdown_executors,
+)
 from vault_editor.config import load_config
 from vault_editor.images import (
+    configure_cache,
     download_image,
     generate_openai_image,
     search_tmdb_poster,
@@ -15,15 +24,27 @@ from vault_editor.images import (
     search_open_library_isbn,
     search_wikimedia,
 )
-from vault_editor.notes import find_markers, iter_markdown_files, read_note, write_note
+from vault_editor.notes import (
+    ImageMarker,
+    apply_edits,
+    find_markers,
+    iter_markdown_files,
+    note_changed_since,
+    note_has_markers,
+    note_mtime_ns,
+    read_note,
+    write_note,
+)
 
 
-def backup_note(note_path: Path, vault_path: Path, backup_root: Path) -> Path:
+def backup_note(
+    note_path: Path, vault_path: Path, backup_root: Path, original: str
+) -> Path:
     relative = note_path.relative_to(vault_path)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = backup_root / f"{relative.as_posix()}.{timestamp}.bak"
     backup_path.parent.mkdir(parents=True, exist_ok=True)
-    backup_path.write_text(note_path.read_text(encoding="utf-8"), encoding="utf-8")
+    backup_path.write_text(original, encoding="utf-8")
     return backup_path
 
 
@@ -49,51 +70,100 @@ def build_replacement(
     return f"![[{rel_path}]]"
 
 
-def process_note(
-    note_path: Path,
-    vault_path: Path,
+def resolve_marker(
+    kind: str,
+    query: str,
     attachments_dir: Path,
     openai_api_key: str,
     tmdb_api_key: str,
-) -> tuple[str, int, int]:
+) -> tuple[Path | None, str | None]:
+    # Runs on a worker thread, so failures are returned for the main thread to
+    # report rather than printed here.
+    result = None
+    if kind == "IMAGE":
+        result = search_wikimedia(query)
+    elif kind == "BOOK":
+        result = search_open_library_cover(query)
+    elif kind == "BOOKISBN":
+        result = search_open_library_isbn(query)
+    elif kind == "MOVIE":
+        result = search_tmdb_poster(query, tmdb_api_key)
+    elif kind == "TV":
+        result = search_tmdb_tv_poster(query, tmdb_api_key)
+    elif kind == "AIIMAGE":
+        try:
+            return generate_openai_image(query, openai_api_key, attachments_dir), None
+        except Exception as exc:
+            return None, f"OpenAI image generation failed for '{query}': {exc}"
+
+    if not result:
+        return None, None
+    return download_image(result, attachments_dir), None
+
+
+class MarkerResolver:
+    """Resolves each (kind, query) once per run on a shared executor."""
+
+    def __init__(
+        self,
+        executor: Executor,
+        attachments_dir: Path,
+        openai_api_key: str,
+        tmdb_api_key: str,
+    ) -> None:
+        self._executor = executor
+        self._attachments_dir = attachments_dir
+        self._openai_api_key = openai_api_key
+        self._tmdb_api_key = tmdb_api_key
+        self._futures: dict[
+            tuple[str, str], Future[tuple[Path | None, str | None]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, kind: str, query: str
+    ) -> Future[tuple[Path | None, str | None]]:
+        key = (kind, query)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(
+                    resolve_marker,
+                    kind,
+                    query,
+                    self._attachments_dir,
+                    self._openai_api_key,
+                    self._tmdb_api_key,
+                )
+                self._futures[key] = future
+            return future
+
+
+def collect_markers(
+    note_path: Path, resolver: MarkerResolver
+) -> tuple[str, list[ImageMarker], int]:
+    mtime_ns = note_mtime_ns(note_path)
     original = read_note(note_path)
     markers = find_markers(original)
-    if not markers:
-        return original, 0, 0
-
-    updated = original
-    offset = 0
-    replacements = 0
     for marker in markers:
-        image_path: Path | None = None
-        if marker.kind == "IMAGE":
-            result = search_wikimedia(marker.query)
-            if result:
-                image_path = download_image(result, attachments_dir)
-        elif marker.kind == "BOOK":
-            result = search_open_library_cover(marker.query)
-            if result:
-                image_path = download_image(result, attachments_dir)
-        elif marker.kind == "BOOKISBN":
-            result = search_open_library_isbn(marker.query)
-            if result:
-                image_path = download_image(result, attachments_dir)
-        elif marker.kind == "MOVIE":
-            result = search_tmdb_poster(marker.query, tmdb_api_key)
-            if result:
-                image_path = download_image(result, attachments_dir)
-        elif marker.kind == "TV":
-            result = search_tmdb_tv_poster(marker.query, tmdb_api_key)
-            if result:
-                image_path = download_image(result, attachments_dir)
-        elif marker.kind == "AIIMAGE":
-            try:
-                image_path = generate_openai_image(
-                    marker.query, openai_api_key, attachments_dir
-                )
-            except Exception as exc:
-                print(f"OpenAI image generation failed for '{marker.query}': {exc}")
+        resolver.submit(marker.kind, marker.query)
+    return original, markers, mtime_ns
+
 
+def process_note(
+    original: str,
+    markers: list[ImageMarker],
+    vault_path: Path,
+    resolver: MarkerResolver,
+) -> tuple[str, int]:
+    edits: list[tuple[int, int, str]] = []
+    reported: set[tuple[str, str]] = set()
+    for marker in markers:
+        key = (marker.kind, marker.query)
+        image_path, error = resolver.submit(*key).result()
+        if error and key not in reported:
+            print(error)
+            reported.add(key)
         if not image_path:
             continue
 
@@ -104,14 +174,9 @@ def process_note(
             marker.quoted,
             marker.quote_char,
         )
-        replacements += 1
-
-        start = marker.start + offset
-        end = marker.end + offset
-        updated = updated[:start] + replacement + updated[end:]
-        offset += len(replacement) - (marker.end - marker.start)
+        edits.append((marker.start, marker.end, replacement))
 
-    return updated, len(markers), replacements
+    return apply_edits(original, edits), len(edits)
 
 
 def main() -> int:
@@ -141,13 +206,20 @@ def main() -> int:
     vault_path = config.vault_path
     attachments_dir = vault_path / config.attachments_dir
     backup_root = vault_path / config.backup_dir
+    configure_cache(backup_root)
 
+    notes: Iterable[Path]
     if args.note:
-        notes = [vault_path / args.note]
+        note_path = vault_path / args.note
+        if not note_path.exists():
+            print(f"Note not found: {note_path}")
+            return 1
+        notes = [note_path]
     else:
-        notes = list(iter_markdown_files(vault_path))
+        notes = iter_markdown_files(vault_path, skip_dirs=[backup_root])
 
     if not args.apply:
+        notes = list(notes)
         print(f"Found {len(notes)} note(s) in vault scan:")
         for note_path in notes:
             try:
@@ -155,52 +227,81 @@ def main() -> int:
             except ValueError:
                 rel_note = str(note_path)
 
-            marker_flag = ""
-            if note_path.exists():
-                try:
-                    marker_flag = " ***" if find_markers(read_note(note_path)) else ""
-                except OSError:
-                    marker_flag = ""
+            try:
+                has_markers = note_has_markers(note_path) and bool(
+                    find_markers(read_note(note_path))
+                )
+                marker_flag = " ***" if has_markers else ""
+            except OSError:
+                marker_flag = ""
 
             print(f"- {rel_note}{marker_flag}")
 
     total_changes = 0
-    for note_path in notes:
-        if not note_path.exists():
-            print(f"Skip missing: {note_path}")
-            continue
+    marker_executor = ThreadPoolExecutor(max_workers=config.parallelism)
+    note_executor = ThreadPoolExecutor(max_workers=config.parallelism)
+    resolver = MarkerResolver(
+        marker_executor,
+        attachments_dir,
+        config.openai_api_key,
+        config.tmdb_api_key,
+    )
 
-        updated, marker_count, replacement_count = process_note(
-            note_path,
-            vault_path,
-            attachments_dir,
-            config.openai_api_key,
-            config.tmdb_api_key,
-        )
-        if marker_count == 0:
-            continue
+    def scan_note(
+        note_path: Path,
+    ) -> tuple[Path, tuple[str, list[ImageMarker], int] | None]:
+        if not note_has_markers(note_path):
+            return note_path, None
+        return note_path, collect_markers(note_path, resolver)
+
+    # Notes are scanned ahead of this loop in a bounded window and their lookups
+    # queued on the shared resolver, so requests for many notes are in flight
+    # together. Results are consumed in order on this thread so prompts and
+    # writes stay sequential.
+    # On an error or Ctrl-C, queued lookups (including billable image
+    # generation) are cancelled rather than run for notes nobody approved.
+    with shutdown_executors(note_executor, marker_executor):
+        for note_path, scan in bounded_map(
+            note_executor,
+            scan_note,
+            notes,
+            config.parallelism * IN_FLIGHT_PER_WORKER,
+        ):
+            if scan is None:
+                continue
 
-        if replacement_count == 0:
-            print(f"No images found for markers in: {note_path}")
-            continue
+            original, markers, mtime_ns = scan
+            if not markers:
+                continue
 
-        if updated == read_note(note_path):
-            continue
+            updated, replacement_count = process_note(
+                original, markers, vault_path, resolver
+            )
+            if replacement_count == 0:
+                print(f"No images found for markers in: {note_path}")
+                continue
+
+            if updated == original:
+                continue
 
-        total_changes += 1
-        print(f"\nPlanned update: {note_path}")
+            total_changes += 1
+            print(f"\nPlanned update: {note_path}")
 
-        if not args.apply:
-            print("Dry-run: no files written.")
-            continue
+            if not args.apply:
+                print("Dry-run: no files written.")
+                continue
+
+            if config.confirm_writes and not args.yes:
+                if not confirm("Apply changes to this note?"):
+                    continue
 
-        if config.confirm_writes and not args.yes:
-            if not confirm("Apply changes to this note?"):
+            if note_changed_since(note_path, mtime_ns):
+                print(f"Skip, note changed since it was scanned: {note_path}")
                 continue
 
-        backup_path = backup_note(note_path, vault_path, backup_root)
-        write_note(note_path, updated)
-        print(f"Updated. Backup saved to: {backup_path}")
+            backup_path = backup_note(note_path, vault_path, backup_root, original)
+            write_note(note_path, updated)
+            print(f"Updated. Backup saved to: {backup_path}")
 
     if total_changes == 0:
         print("No changes needed.")
@@ -2,14 +2,27 @@ from __future__ import annotations
 
 import argparse
 import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterable, Tuple
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from vault_editor.concurrency import (
+    IN_FLIGHT_PER_WORKER,
+    bounded_map,
+    shutdown_executors,
+)
 from vault_editor.config import load_config
 from vault_editor.images import (
+    configure_cache,
     download_image,
     get_tmdb_watch_providers,
     search_open_library_isbn,
@@ -17,36 +30,91 @@ from vault_editor.images import (
     search_tmdb_poster,
     search_tmdb_movie_id,
 )
-from vault_editor.notes import iter_markdown_files, read_note, write_note
+from vault_editor.notes import (
+    iter_markdown_files,
+    note_changed_since,
+    note_mtime_ns,
+    read_note,
+    write_note,
+)
 
 NEEDSINFO_TAG = "needsinfo"
 BOOK_TAG = "book"
 MOVIE_TAG = "movie"
 
+FRONTMATTER_END_PATTERN = re.compile(r"^[ \t]*---[ \t\r]*$", re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+@dataclass(frozen=True)
+class NoteUpdate:
+    original: str
+    mtime_ns: int
+    new_text: str | None = None
+    message: str | None = None
+
+
+def _compile_inline_tag(tag: str) -> re.Pattern[str]:
+    return re.compile(rf"(?<!\S)#{re.escape(tag)}\b", re.IGNORECASE)
+
+
+INLINE_TAG_PATTERNS = {
+    tag: _compile_inline_tag(tag) for tag in (NEEDSINFO_TAG, BOOK_TAG, MOVIE_TAG)
+}
+
 
 def split_frontmatter(text: str) -> Tuple[Dict[str, Any] | None, str, str | None]:
     if not text.startswith("---\n"):
         return None, text, None
 
-    lines = text.splitlines(keepends=True)
-    end_index = None
-    for i in range(1, len(lines)):
-        if lines[i].strip() == "---":
-            end_index = i
-            break
-
-    if end_index is None:
+    match = FRONTMATTER_END_PATTERN.search(text, 4)
+    if match is None:
         return None, text, None
 
-    fm_text = "".join(lines[1:end_index])
-    body = "".join(lines[end_index + 1 :])
-    fm = yaml.safe_load(fm_text) or {}
+    fm_text = text[4 : match.start()]
+    body = text[match.end() + 1 :]
+    fm = yaml.load(fm_text, Loader=SafeLoader) or {}
     return fm, body, fm_text
 
 
+def _is_simple_string(value: Any) -> bool:
+    return isinstance(value, str) and value.isprintable()
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
 def dump_frontmatter(data: Dict[str, Any]) -> str:
-    return yaml.safe_dump(
+    # Frontmatter written by this tool is flat strings and string lists, so emit
+    # those directly in the same double-quoted style and defer anything else to
+    # PyYAML.
+    lines: list[str] = []
+    for key, value in data.items():
+        if not _is_simple_string(key):
+            return _dump_frontmatter_yaml(data)
+        if isinstance(value, list):
+            if not all(_is_simple_string(item) for item in value):
+                return _dump_frontmatter_yaml(data)
+            if not value:
+                lines.append(f"{_quote(key)}: []")
+                continue
+            lines.append(f"{_quote(key)}:")
+            lines.extend(f"- {_quote(item)}" for item in value)
+        elif _is_simple_string(value):
+            lines.append(f"{_quote(key)}: {_quote(value)}")
+        else:
+            return _dump_frontmatter_yaml(data)
+
+    if not lines:
+        return _dump_frontmatter_yaml(data)
+    return "\n".join(lines)
+
+
+def _dump_frontmatter_yaml(data: Dict[str, Any]) -> str:
+    return yaml.dump(
         data,
+        Dumper=yaml.SafeDumper,
         sort_keys=False,
         allow_unicode=True,
         default_flow_style=False,
@@ -77,20 +145,27 @@ def set_tags(value: Any, tags: list[str]) -> Any:
     return tags
 
 
+def _inline_tag_pattern(tag: str) -> re.Pattern[str]:
+    pattern = INLINE_TAG_PATTERNS.get(tag)
+    return pattern if pattern is not None else _compile_inline_tag(tag)
+
+
 def has_inline_tag(text: str, tag: str) -> bool:
-    return re.search(rf"(?<!\S)#{re.escape(tag)}\b", text, re.IGNORECASE) is not None
+    return _inline_tag_pattern(tag).search(text) is not None
 
 
 def remove_inline_tag(text: str, tag: str) -> str:
-    return re.sub(rf"(?<!\S)#{re.escape(tag)}\b", "", text, flags=re.IGNORECASE)
+    return _inline_tag_pattern(tag).sub("", text)
 
 
-def backup_note(note_path: Path, vault_path: Path, backup_root: Path) -> Path:
+def backup_note(
+    note_path: Path, vault_path: Path, backup_root: Path, original: str
+) -> Path:
     relative = note_path.relative_to(vault_path)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = backup_root / f"{relative.as_posix()}.{timestamp}.bak"
     backup_path.parent.mkdir(parents=True, exist_ok=True)
-    backup_path.write_text(note_path.read_text(encoding="utf-8"), encoding="utf-8")
+    backup_path.write_text(original, encoding="utf-8")
     return backup_path
 
 
@@ -102,14 +177,15 @@ def confirm(prompt: str) -> bool:
 def process_note(
     note_path: Path,
     vault_path: Path,
-    backup_root: Path,
     attachments_dir: Path,
     tmdb_api_key: str,
     tmdb_region: str,
-    apply: bool,
-    yes: bool,
-) -> bool:
+) -> NoteUpdate | None:
+    mtime_ns = note_mtime_ns(note_path)
     text = read_note(note_path)
+    if NEEDSINFO_TAG not in text.lower():
+        return None
+
     fm, body, _ = split_frontmatter(text)
 
     if fm is None:
@@ -121,14 +197,15 @@ def process_note(
 
     has_needsinfo = NEEDSINFO_TAG in tags or has_inline_tag(body, NEEDSINFO_TAG)
     if not has_needsinfo:
-        return False
+        return None
 
     has_book = BOOK_TAG in tags or has_inline_tag(body, BOOK_TAG)
     has_movie = MOVIE_TAG in tags or has_inline_tag(body, MOVIE_TAG)
 
     if has_book == has_movie:
-        print(f"Skip ambiguous tags: {note_path}")
-        return False
+        return NoteUpdate(
+            text, mtime_ns, message=f"Skip ambiguous tags: {note_path}"
+        )
 
     updated = False
 
@@ -147,15 +224,17 @@ def process_note(
                 fm["Image"] = f"[[{rel_path}]]"
             updated = True
         else:
-            print(f"No ISBN found for: {note_path}")
-            return False
+            return NoteUpdate(
+                text, mtime_ns, message=f"No ISBN found for: {note_path}"
+            )
 
     if has_movie:
         title = fm.get("title") or fm.get("Title") or note_path.stem
         movie_id = search_tmdb_movie_id(str(title), tmdb_api_key)
         if not movie_id:
-            print(f"No TMDb match for: {note_path}")
-            return False
+            return NoteUpdate(
+                text, mtime_ns, message=f"No TMDb match for: {note_path}"
+            )
 
         poster = search_tmdb_poster(str(title), tmdb_api_key)
         if poster:
@@ -180,25 +259,47 @@ def process_note(
         else:
             fm["tags"] = tags
 
-        body = remove_inline_tag(body, NEEDSINFO_TAG)
-        body = re.sub(r"\n{3,}", "\n\n", body)
+        new_body = remove_inline_tag(body, NEEDSINFO_TAG)
+        if new_body != body:
+            new_body = BLANK_LINES_PATTERN.sub("\n\n", new_body)
+        body = new_body
 
         fm_text = dump_frontmatter(fm)
         new_text = f"---\n{fm_text}\n---\n{body}"
+        if new_text == text:
+            return None
+        return NoteUpdate(text, mtime_ns, new_text=new_text)
+
+    return None
 
-        if not apply:
-            print(f"Planned update: {note_path}")
-            return True
 
-        if not yes and not confirm(f"Apply changes to this note?"):
-            return False
+def apply_update(
+    note_path: Path,
+    update: NoteUpdate,
+    vault_path: Path,
+    backup_root: Path,
+    apply: bool,
+    yes: bool,
+) -> bool:
+    new_text = update.new_text
+    if new_text is None:
+        return False
 
-        backup_note(note_path, vault_path, backup_root)
-        write_note(note_path, new_text)
-        print(f"Updated: {note_path}")
+    if not apply:
+        print(f"Planned update: {note_path}")
         return True
 
-    return False
+    if not yes and not confirm(f"Apply changes to this note?"):
+        return False
+
+    if note_changed_since(note_path, update.mtime_ns):
+        print(f"Skip, note changed since it was scanned: {note_path}")
+        return False
+
+    backup_note(note_path, vault_path, backup_root, update.original)
+    write_note(note_path, new_text)
+    print(f"Updated: {note_path}")
+    return True
 
 
 def main() -> int:
@@ -228,28 +329,56 @@ def main() -> int:
     vault_path = config.vault_path
     attachments_dir = vault_path / config.attachments_dir
     backup_root = vault_path / config.backup_dir
+    configure_cache(backup_root)
 
+    notes: Iterable[Path]
     if args.note:
-        notes = [vault_path / args.note]
-    else:
-        notes = list(iter_markdown_files(vault_path))
-
-    total_changes = 0
-    for note_path in notes:
+        note_path = vault_path / args.note
         if not note_path.exists():
-            continue
+            print(f"Note not found: {note_path}")
+            return 1
+        notes = [note_path]
+    else:
+        notes = iter_markdown_files(vault_path, skip_dirs=[backup_root])
 
-        if process_note(
+    def scan_note(note_path: Path) -> tuple[Path, NoteUpdate | None]:
+        return note_path, process_note(
             note_path,
             vault_path,
-            backup_root,
             attachments_dir,
             config.tmdb_api_key,
             config.tmdb_region,
-            args.apply,
-            args.yes,
+        )
+
+    total_changes = 0
+    # Lookups run concurrently; messages, prompts and writes happen in order on
+    # this thread so worker output never interleaves with a prompt.
+    # On an error or Ctrl-C, queued lookups are cancelled rather than drained.
+    executor = ThreadPoolExecutor(max_workers=config.parallelism)
+    with shutdown_executors(executor):
+        for note_path, update in bounded_map(
+            executor,
+            scan_note,
+            notes,
+            config.parallelism * IN_FLIGHT_PER_WORKER,
         ):
-            total_changes += 1
+            if update is None:
+                continue
+
+            if update.message:
+                print(update.message)
+            if update.new_text is None:
+                continue
+
+            if apply_update(
+                note_path,
+                update,
+                vault_path,
+                backup_root,
+                args.apply,
+                args.yes,
+            ):
+                total_changes += 1
 
     if total_changes == 0:
         print("No changes needed.")
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+class ResponseCache:
+    """Small SQLite-backed key/value store for JSON API responses.
+
+    The cache is best-effort: if the database cannot be created, read or written
+    (a damaged file, a lock that outlasts the timeout), it is switched off for the
+    rest of the run and every lookup becomes a miss.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._disabled = False
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            self._disabled = True
+            return
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._lock:
+            if self._disabled:
+                return None
+            try:
+                conn = sqlite3.connect(self.path, timeout=10)
+                try:
+                    with conn:
+                        return conn.execute(sql, params).fetchone()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                self._disabled = True
+                return None
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return json.dumps(parts, separators=(",", ":"))
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._execute(
+            "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+        )
+        if row is None:
+            return None
+        value, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time()),
+        )
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Deque, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+IN_FLIGHT_PER_WORKER = 4
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_in_flight: int,
+) -> Iterator[R]:
+    """Ordered ``Executor.map`` that keeps at most ``max_in_flight`` results pending."""
+    pending: Deque[Future[R]] = deque()
+    for item in items:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+@contextmanager
+def shutdown_executors(*executors: Executor) -> Iterator[None]:
+    """Shut down ``executors`` on exit, dropping queued work if the body raised."""
+    try:
+        yield
+    except BaseException:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    for executor in executors:
+        executor.shutdown(wait=True)
@@ -14,6 +14,7 @@ class Config:
     attachments_dir: str
     backup_dir: str
     confirm_writes: bool
+    parallelism: int
 
 
 def load_config(repo_root: Path) -> Config:
@@ -38,4 +39,5 @@ def load_config(repo_root: Path) -> Config:
         attachments_dir=data.get("attachments_dir", "attachments"),
         backup_dir=data.get("backup_dir", ".vault_backups"),
         confirm_writes=bool(data.get("confirm_writes", True)),
+        parallelism=max(1, int(data.get("parallelism", 8))),
     )
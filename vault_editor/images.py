@@ -1,12 +1,23 @@
 from __future__ import annotations
 
 import base64
+import functools
+import hashlib
+import os
 import re
+import threading
+import time
+import uuid
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from vault_editor.cache import ResponseCache
 
 USER_AGENT = "vault-editor/0.1.0 (https://example.com; contact=local)"
 
@@ -20,6 +31,49 @@ TMDB_SEARCH_TV = "https://api.themoviedb.org/3/search/tv"
 TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w500"
 TMDB_WATCH_PROVIDERS_MOVIE = "https://api.themoviedb.org/3/movie/{media_id}/watch/providers"
 TMDB_WATCH_PROVIDERS_TV = "https://api.themoviedb.org/3/tv/{media_id}/watch/providers"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+TMDB_CACHE_FILENAME = ".tmdb_cache.sqlite"
+TMDB_CACHE_TTL_SECONDS = 60 * 60
+TMDB_MIN_REQUEST_INTERVAL = 0.025
+COVER_PROBE_CACHE_FILENAME = ".isbn_probe.sqlite"
+COVER_PROBE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+_tmdb_cache: Optional[ResponseCache] = None
+_cover_probe_cache: Optional[ResponseCache] = None
+
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": USER_AGENT})
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+
+class _RateLimiter:
+    def __init__(self, min_interval: float) -> None:
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_tmdb_rate_limiter = _RateLimiter(TMDB_MIN_REQUEST_INTERVAL)
 
 
 @dataclass(frozen=True)
@@ -28,6 +82,14 @@ class ImageResult:
     url: str
 
 
+def configure_cache(cache_dir: Path) -> None:
+    global _tmdb_cache, _cover_probe_cache
+    _tmdb_cache = ResponseCache(cache_dir / TMDB_CACHE_FILENAME, TMDB_CACHE_TTL_SECONDS)
+    _cover_probe_cache = ResponseCache(
+        cache_dir / COVER_PROBE_CACHE_FILENAME, COVER_PROBE_CACHE_TTL_SECONDS
+    )
+
+
 def _sanitize_filename(name: str) -> str:
     name = re.sub(r"\s+", "_", name)
     name = re.sub(r"[^A-Za-z0-9._-]", "", name)
@@ -43,9 +105,7 @@ def search_wikimedia(query: str) -> Optional[ImageResult]:
         "srnamespace": 6,
         "srlimit": 1,
     }
-    response = requests.get(
-        WIKI_API, params=params, timeout=20, headers={"User-Agent": USER_AGENT}
-    )
+    response = _SESSION.get(WIKI_API, params=params, timeout=20)
     response.raise_for_status()
     data = response.json()
     results = data.get("query", {}).get("search", [])
@@ -60,9 +120,7 @@ def search_wikimedia(query: str) -> Optional[ImageResult]:
         "prop": "imageinfo",
         "iiprop": "url",
     }
-    info_response = requests.get(
-        WIKI_API, params=info_params, timeout=20, headers={"User-Agent": USER_AGENT}
-    )
+    info_response = _SESSION.get(WIKI_API, params=info_params, timeout=20)
     info_response.raise_for_status()
     info_data = info_response.json()
     pages = info_data.get("query", {}).get("pages", {})
@@ -81,9 +139,7 @@ def search_open_library_cover(query: str) -> Optional[ImageResult]:
         "limit": 1,
         "fields": "title,cover_i",
     }
-    response = requests.get(
-        OPEN_LIBRARY_SEARCH, params=params, timeout=20, headers={"User-Agent": USER_AGENT}
-    )
+    response = _SESSION.get(OPEN_LIBRARY_SEARCH, params=params, timeout=20)
     response.raise_for_status()
     data = response.json()
     docs = data.get("docs", [])
@@ -100,23 +156,39 @@ def search_open_library_cover(query: str) -> Optional[ImageResult]:
 
 
 def search_open_library_isbn(isbn: str) -> Optional[ImageResult]:
-    isbn = re.sub(r"[^0-9Xx]", "", isbn)
+    isbn = re.sub(r"[^0-9Xx]", "", isbn).upper()
     if not isbn:
         return None
 
     url = OPEN_LIBRARY_COVER_ISBN.format(isbn=isbn)
     try:
-        response = requests.head(
-            url, timeout=15, headers={"User-Agent": USER_AGENT}, allow_redirects=True
-        )
-        if response.status_code >= 400:
+        if not _cover_exists(url):
             return None
     except requests.RequestException:
         return None
-
     return ImageResult(title=f"ISBN {isbn}", url=url)
 
 
+@functools.lru_cache(maxsize=2048)
+def _cover_exists(url: str) -> bool:
+    cache_key = ResponseCache.make_key(url)
+    if _cover_probe_cache is not None:
+        cached = _cover_probe_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    response = _SESSION.head(url, timeout=15, allow_redirects=True)
+    if response.status_code >= 400 and response.status_code not in (404, 410):
+        # Rate limits, timeouts and server errors are not a final answer; raise
+        # so neither the in-process nor the on-disk cache keeps them.
+        response.raise_for_status()
+
+    exists = response.status_code < 400
+    if _cover_probe_cache is not None:
+        _cover_probe_cache.set(cache_key, exists)
+    return exists
+
+
 def search_open_library_isbn_by_title(
     title: str, author: Optional[str] = None
 ) -> Optional[str]:
@@ -128,9 +200,7 @@ def search_open_library_isbn_by_title(
     if author:
         params["author"] = author
 
-    response = requests.get(
-        OPEN_LIBRARY_SEARCH, params=params, timeout=20, headers={"User-Agent": USER_AGENT}
-    )
+    response = _SESSION.get(OPEN_LIBRARY_SEARCH, params=params, timeout=20)
     response.raise_for_status()
     data = response.json()
     docs = data.get("docs", [])
@@ -145,21 +215,27 @@ def search_open_library_isbn_by_title(
 
 def _tmdb_headers(api_key: str) -> dict[str, str]:
     if api_key.startswith("ey"):
-        return {"Authorization": f"Bearer {api_key}", "User-Agent": USER_AGENT}
-    return {"User-Agent": USER_AGENT}
+        return {"Authorization": f"Bearer {api_key}"}
+    return {}
 
 
-def _tmdb_search_first_result(
-    endpoint: str, query: str, api_key: str
-) -> Optional[dict]:
+@functools.lru_cache(maxsize=1024)
+def _tmdb_search_cached(endpoint: str, query: str, api_key: str) -> Optional[dict]:
     if not api_key:
         return None
 
+    cache_key = ResponseCache.make_key(endpoint, query, "")
+    if _tmdb_cache is not None:
+        cached = _tmdb_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
     params = {"query": query, "include_adult": "false", "language": "en-US"}
     if not api_key.startswith("ey"):
         params["api_key"] = api_key
 
-    response = requests.get(
+    _tmdb_rate_limiter.wait()
+    response = _SESSION.get(
         endpoint,
         params=params,
         timeout=20,
@@ -170,11 +246,14 @@ def _tmdb_search_first_result(
     results = data.get("results", [])
     if not results:
         return None
+
+    if _tmdb_cache is not None:
+        _tmdb_cache.set(cache_key, results[0])
     return results[0]
 
 
 def search_tmdb_poster(query: str, api_key: str) -> Optional[ImageResult]:
-    result = _tmdb_search_first_result(TMDB_SEARCH_MOVIE, query, api_key)
+    result = _tmdb_search_cached(TMDB_SEARCH_MOVIE, query, api_key)
     if not result:
         return None
 
@@ -188,7 +267,7 @@ def search_tmdb_poster(query: str, api_key: str) -> Optional[ImageResult]:
 
 
 def search_tmdb_tv_poster(query: str, api_key: str) -> Optional[ImageResult]:
-    result = _tmdb_search_first_result(TMDB_SEARCH_TV, query, api_key)
+    result = _tmdb_search_cached(TMDB_SEARCH_TV, query, api_key)
     if not result:
         return None
 
@@ -202,14 +281,14 @@ def search_tmdb_tv_poster(query: str, api_key: str) -> Optional[ImageResult]:
 
 
 def search_tmdb_movie_id(query: str, api_key: str) -> Optional[int]:
-    result = _tmdb_search_first_result(TMDB_SEARCH_MOVIE, query, api_key)
+    result = _tmdb_search_cached(TMDB_SEARCH_MOVIE, query, api_key)
     if not result:
         return None
     return result.get("id")
 
 
 def search_tmdb_tv_id(query: str, api_key: str) -> Optional[int]:
-    result = _tmdb_search_first_result(TMDB_SEARCH_TV, query, api_key)
+    result = _tmdb_search_cached(TMDB_SEARCH_TV, query, api_key)
     if not result:
         return None
     return result.get("id")
@@ -220,16 +299,29 @@ def get_tmdb_watch_providers(
 ) -> list[str]:
     if not api_key:
         return []
+    return list(_tmdb_watch_providers_cached(media_type, media_id, api_key, region))
+
 
+@functools.lru_cache(maxsize=1024)
+def _tmdb_watch_providers_cached(
+    media_type: str, media_id: int, api_key: str, region: str
+) -> tuple[str, ...]:
     endpoint = (
         TMDB_WATCH_PROVIDERS_MOVIE if media_type == "movie" else TMDB_WATCH_PROVIDERS_TV
     )
     url = endpoint.format(media_id=media_id)
+    cache_key = ResponseCache.make_key(url, "", region.upper())
+    if _tmdb_cache is not None:
+        cached = _tmdb_cache.get(cache_key)
+        if cached is not None:
+            return tuple(cached)
+
     params = {}
     if not api_key.startswith("ey"):
         params["api_key"] = api_key
 
-    response = requests.get(
+    _tmdb_rate_limiter.wait()
+    response = _SESSION.get(
         url,
         params=params,
         timeout=20,
@@ -246,7 +338,10 @@ def get_tmdb_watch_providers(
             name = item.get("provider_name")
             if name and name not in providers:
                 providers.append(name)
-    return providers
+
+    if _tmdb_cache is not None:
+        _tmdb_cache.set(cache_key, providers)
+    return tuple(providers)
 
 
 def generate_openai_image(prompt: str, api_key: str, dest_dir: Path) -> Path:
@@ -270,7 +365,7 @@ def generate_openai_image(prompt: str, api_key: str, dest_dir: Path) -> Path:
         "User-Agent": USER_AGENT,
     }
 
-    response = requests.post(OPENAI_IMAGE_API, json=payload, timeout=60, headers=headers)
+    response = _SESSION.post(OPENAI_IMAGE_API, json=payload, timeout=60, headers=headers)
     if response.status_code >= 400:
         raise ValueError(
             f"OpenAI error {response.status_code}: {response.text.strip()}"
@@ -291,7 +386,7 @@ def generate_openai_image(prompt: str, api_key: str, dest_dir: Path) -> Path:
     if not url:
         raise ValueError("OpenAI image generation returned no usable image data.")
 
-    with requests.get(url, stream=True, timeout=30, headers={"User-Agent": USER_AGENT}) as resp:
+    with _SESSION.get(url, stream=True, timeout=30) as resp:
         resp.raise_for_status()
         with open(target, "wb") as f:
             for chunk in resp.iter_content(chunk_size=1024 * 64):
@@ -303,20 +398,30 @@ def generate_openai_image(prompt: str, api_key: str, dest_dir: Path) -> Path:
 
 def download_image(result: ImageResult, dest_dir: Path) -> Path:
     dest_dir.mkdir(parents=True, exist_ok=True)
-    filename = _sanitize_filename(Path(result.url).name)
-    if not filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".webp")):
-        filename = f"{filename}.jpg"
-
-    target = dest_dir / filename
+    url_path = Path(urlsplit(result.url).path)
+    ext = url_path.suffix.lower()
+    if ext not in IMAGE_EXTENSIONS:
+        ext = ".jpg"
+    stem = _sanitize_filename(url_path.stem)[:80]
+    digest = hashlib.sha1(result.url.encode("utf-8")).hexdigest()[:16]
+
+    target = dest_dir / f"{stem}_{digest}{ext}"
     if target.exists():
         return target
 
-    with requests.get(
-        result.url, stream=True, timeout=30, headers={"User-Agent": USER_AGENT}
-    ) as resp:
-        resp.raise_for_status()
-        with open(target, "wb") as f:
+    # Stream into a private temp file and move it into place, so concurrent
+    # callers never see a partial image and a failed download leaves no file.
+    tmp_path = dest_dir / f".{target.name}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "xb") as f, _SESSION.get(
+            result.url, stream=True, timeout=30
+        ) as resp:
+            resp.raise_for_status()
             for chunk in resp.iter_content(chunk_size=1024 * 64):
                 if chunk:
                     f.write(chunk)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     return target
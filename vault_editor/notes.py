@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import os
 import re
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
 MARKER_PATTERN = re.compile(
     r"(?P<quote>[\"'])?<!--\s*(?P<kind>IMAGE|BOOK|BOOKISBN|AIIMAGE|MOVIE|TV)\s*:\s*(?P<query>[^|>]+?)\s*(\|\s*(?P<alt>[^>]+?)\s*)?-->(?P=quote)?",
     re.IGNORECASE,
 )
+MARKER_START_PATTERN = re.compile(
+    r"<!--\s*(?:IMAGE|BOOK|BOOKISBN|AIIMAGE|MOVIE|TV)", re.IGNORECASE
+)
+MARKER_TOKEN = "<!--"
+MARKER_TOKEN_BYTES = MARKER_TOKEN.encode("ascii")
+MARKER_SCAN_CHUNK_SIZE = 64 * 1024
+IGNORED_DIR_NAMES = frozenset({".git", ".obsidian"})
 
 
 @dataclass(frozen=True)
@@ -23,8 +32,12 @@ class ImageMarker:
 
 
 def find_markers(text: str) -> List[ImageMarker]:
+    first = text.find(MARKER_TOKEN)
+    if first == -1:
+        return []
+
     markers: List[ImageMarker] = []
-    for match in MARKER_PATTERN.finditer(text):
+    for match in _iter_marker_matches(text, first):
         kind = match.group("kind").strip().upper()
         query = match.group("query").strip()
         alt = match.group("alt")
@@ -45,13 +58,99 @@ def find_markers(text: str) -> List[ImageMarker]:
     return markers
 
 
-def iter_markdown_files(vault_path: Path) -> Iterable[Path]:
-    return (p for p in vault_path.rglob("*.md") if p.is_file())
+def _iter_marker_matches(text: str, pos: int) -> Iterator[re.Match[str]]:
+    # Locate candidates with the cheap start pattern, then run the full pattern
+    # anchored at each one (or at the opening quote just before it).
+    last_end = 0
+    for candidate in MARKER_START_PATTERN.finditer(text, pos):
+        start = candidate.start()
+        if start < last_end:
+            continue
+        match = None
+        if start > last_end and text[start - 1] in "\"'":
+            match = MARKER_PATTERN.match(text, start - 1)
+        if match is None:
+            match = MARKER_PATTERN.match(text, start)
+        if match is None:
+            continue
+        last_end = match.end()
+        yield match
+
+
+def note_has_markers(path: Path) -> bool:
+    overlap = len(MARKER_TOKEN_BYTES) - 1
+    tail = b""
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(MARKER_SCAN_CHUNK_SIZE)
+            if not chunk:
+                return False
+            if MARKER_TOKEN_BYTES in tail + chunk:
+                return True
+            tail = chunk[-overlap:]
+
+
+def apply_edits(text: str, edits: Sequence[Tuple[int, int, str]]) -> str:
+    parts: List[str] = [""] * (2 * len(edits) + 1)
+    prev = 0
+    for i, (start, end, replacement) in enumerate(edits):
+        parts[2 * i] = text[prev:start]
+        parts[2 * i + 1] = replacement
+        prev = end
+    parts[-1] = text[prev:]
+    return "".join(parts)
+
+
+def iter_markdown_files(
+    vault_path: Path, skip_dirs: Iterable[Path] = ()
+) -> Iterator[Path]:
+    skipped = {os.path.normpath(p) for p in skip_dirs}
+    stack = [os.fspath(vault_path)]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except PermissionError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in IGNORED_DIR_NAMES:
+                        continue
+                    if os.path.normpath(entry.path) in skipped:
+                        continue
+                    stack.append(entry.path)
+                elif entry.name.endswith(".md") and entry.is_file():
+                    yield Path(entry.path)
 
 
 def read_note(path: Path) -> str:
     return path.read_text(encoding="utf-8")
 
 
+def note_mtime_ns(path: Path) -> int:
+    return path.stat().st_mtime_ns
+
+
+def note_changed_since(path: Path, mtime_ns: int) -> bool:
+    try:
+        return note_mtime_ns(path) != mtime_ns
+    except FileNotFoundError:
+        return True
+
+
 def write_note(path: Path, content: str) -> None:
-    path.write_text(content, encoding="utf-8")
+    # Write through symlinks so the linked note is updated, not replaced.
+    target = Path(os.path.realpath(path))
+    tmp_path = target.with_name(f"{target.name}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if target.exists():
+            shutil.copymode(target, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise